@@ -3,6 +3,8 @@ set -e
 
 echo "Starting database backup via Supabase API..."
 
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+
 # Create backup directory
 BACKUP_DIR="backup-$(date +%Y%m%d-%H%M%S)"
 mkdir -p "$BACKUP_DIR"
@@ -14,14 +16,21 @@ pip install requests
 cat > backup_via_api.py << 'EOF'
 import os
 import json
-import requests
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from urllib.parse import quote
+from request_scheduler import get_scheduler
 
 # Get environment variables
 project_id = os.environ.get('SUPABASE_PROJECT_ID')
 service_key = os.environ.get('SUPABASE_SERVICE_ROLE_KEY')
 backup_dir = os.environ.get('BACKUP_DIR')
+# Tables are exported in parallel; the pool is as large as the scheduler's
+# ceiling (BACKUP_HTTP_MAX_CONCURRENCY) and the scheduler keeps the real
+# concurrency within what the Supabase host accepts
+scheduler = get_scheduler()
+max_workers = int(scheduler.max_concurrency)
 
 if not project_id or not service_key:
     print("Error: Missing SUPABASE_PROJECT_ID or SUPABASE_SERVICE_ROLE_KEY")
@@ -43,13 +52,14 @@ def get_tables():
     try:
         # Use PostgREST API to get table information
         url = f'{base_url}/rest/v1/rpc/get_schema_tables'
-        response = requests.get(url, headers=headers)
+        response = scheduler.get(url, headers=headers)
         if response.status_code == 200:
             return response.json()
         else:
             # Fallback: get common tables
             print("Using fallback table detection...")
-            common_tables = ['profiles', 'campaigns', 'tasks', 'groups', 'user_groups', 'active_agents']
+            common_tables = ['profiles', 'campaigns', 'tasks', 'groups', 'user_groups', 'active_agents',
+                             'task_assignments', 'evidence', 'payments']
             return [{'table_name': table} for table in common_tables]
     except Exception as e:
         print(f"Error getting tables: {e}")
@@ -61,35 +71,106 @@ def get_tables():
             {'table_name': 'groups'},
             {'table_name': 'user_groups'},
             {'table_name': 'active_agents'},
-            {'table_name': 'task_assignments'}
+            {'table_name': 'task_assignments'},
+            {'table_name': 'evidence'},
+            {'table_name': 'payments'}
         ]
 
+# PostgREST caps every response at the project's max-rows setting (1000 on
+# Supabase by default), so tables are exported page by page
+page_size = int(os.environ.get('BACKUP_PAGE_SIZE', '1000'))
+
+def parse_total(content_range):
+    """Total row count from a Content-Range header like '0-999/12345'"""
+    if content_range and '/' in content_range:
+        total = content_range.rsplit('/', 1)[1]
+        if total.isdigit():
+            return int(total)
+    return None
+
+# Backup table data
+def table_order(table_name):
+    """A total order for paging: the id column, else every column.
+
+    Returns the PostgREST order value, '' for an empty table, or None when the
+    table can't be ordered (unordered offset pages may skip or repeat rows).
+    """
+    url = f'{base_url}/rest/v1/{table_name}?select=*&limit=1&order=id'
+    response = scheduler.get(url, headers=headers)
+    if response.status_code == 200:
+        return 'id'
+    if response.status_code != 400:
+        return None
+    
+    # No id column (e.g. join tables and views): order by all columns
+    response = scheduler.get(f'{base_url}/rest/v1/{table_name}?select=*&limit=1', headers=headers)
+    if response.status_code != 200:
+        return None
+    rows = response.json()
+    if not rows:
+        return ''
+    order = ','.join(quote(column) for column in rows[0])
+    response = scheduler.get(f'{base_url}/rest/v1/{table_name}?select=*&limit=1&order={order}', headers=headers)
+    return order if response.status_code == 200 else None
+
 # Backup table data
 def backup_table(table_name):
+    """Export every row of a table; returns the row count, or None on failure"""
     try:
         print(f"  Backing up table: {table_name}")
-        url = f'{base_url}/rest/v1/{table_name}?select=*'
-        response = requests.get(url, headers=headers)
+        order = table_order(table_name)
+        if order is None:
+            print(f"    Warning: Could not backup {table_name} (no stable order for paging)")
+            return None
         
-        if response.status_code == 200:
-            data = response.json()
-            # Save as JSON
-            with open(os.path.join(backup_dir, f'{table_name}.json'), 'w') as f:
-                json.dump(data, f, indent=2, default=str)
-            print(f"    Saved {len(data)} records from {table_name}")
-        else:
-            print(f"    Warning: Could not backup {table_name} (status: {response.status_code})")
+        data = []
+        total = None
+        while True:
+            url = f'{base_url}/rest/v1/{table_name}?select=*&offset={len(data)}&limit={page_size}'
+            if order:
+                url += f'&order={order}'
+            page_headers = dict(headers, Prefer='count=exact') if not data else headers
+            response = scheduler.get(url, headers=page_headers)
+            
+            if response.status_code not in (200, 206):
+                print(f"    Warning: Could not backup {table_name} (status: {response.status_code})")
+                return None
+            
+            if total is None:
+                total = parse_total(response.headers.get('Content-Range'))
+            page = response.json()
+            # Stop on an empty page rather than a short one: the server's cap
+            # may be below page_size
+            if not page:
+                break
+            data.extend(page)
+            if total is not None and len(data) >= total:
+                break
+        
+        if total is not None and len(data) != total:
+            print(f"    Warning: {table_name} changed during export ({len(data)} rows saved, {total} counted)")
+        
+        # Save as JSON
+        with open(os.path.join(backup_dir, f'{table_name}.json'), 'w') as f:
+            json.dump(data, f, indent=2, default=str)
+        print(f"    Saved {len(data)} records from {table_name}")
+        return len(data)
     except Exception as e:
         print(f"    Error backing up {table_name}: {e}")
+    return None
 
 # Main backup process
 try:
     tables = get_tables()
     print(f"Found {len(tables)} tables to backup")
     
-    for table in tables:
-        table_name = table.get('table_name', table.get('name', str(table)))
-        backup_table(table_name)
+    table_names = [table.get('table_name', table.get('name', str(table))) for table in tables]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(backup_table, table_names))
+    row_counts = {name: count for name, count in zip(table_names, results) if count is not None}
+    failed_tables = [name for name in table_names if name not in row_counts]
+    if failed_tables:
+        print(f"Warning: {len(failed_tables)} tables could not be backed up: {', '.join(failed_tables)}")
     
     # Create metadata file
     metadata = {
@@ -97,7 +178,9 @@ try:
         'project_id': project_id,
         'backup_type': 'api_backup',
         'version': '1.0',
-        'tables_backed_up': len(tables)
+        'tables_backed_up': len(tables) - len(failed_tables),
+        'tables_failed': failed_tables,
+        'row_counts': row_counts
     }
     
     with open(os.path.join(backup_dir, 'metadata.json'), 'w') as f:
@@ -112,6 +195,7 @@ EOF
 
 # Run the backup script
 export BACKUP_DIR="$BACKUP_DIR"
+export PYTHONPATH="$SCRIPT_DIR${PYTHONPATH:+:$PYTHONPATH}"
 python3 backup_via_api.py
 
 # Compress backup
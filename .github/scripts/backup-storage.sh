@@ -3,42 +3,110 @@ set -e
 
 echo "Starting storage backup..."
 
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+
 # Create backup directory
-BACKUP_DIR="storage-$(date +%Y%m%d-%H%M%S)"
+TIMESTAMP="$(date +%Y%m%d-%H%M%S)"
+BACKUP_DIR="storage-$TIMESTAMP"
 mkdir -p "$BACKUP_DIR"
 
 # Install required tools
-pip install supabase
+pip install supabase requests
 
 # Python script to download storage objects
 cat > download_storage.py << 'EOF'
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import importlib.util
+import httpx
 from supabase import create_client
+from request_scheduler import get_scheduler
+from sharded_archive import DEFAULT_SHARD_SIZE_MB, ShardedArchiveWriter, ShardUploader
 import sys
 
 url = os.environ.get('SUPABASE_URL')
 key = os.environ.get('SUPABASE_SERVICE_ROLE_KEY')
 backup_dir = os.environ.get('BACKUP_DIR')
+archive_prefix = os.environ.get('ARCHIVE_PREFIX')
+shard_size_mb = int(os.environ.get('BACKUP_SHARD_SIZE_MB', DEFAULT_SHARD_SIZE_MB))
+upload_target = os.environ.get('BACKUP_UPLOAD_TARGET')
 
 if not url or not key:
     print("Error: Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY")
     sys.exit(1)
 
+def load_onedrive_uploader():
+    # upload-to-onedrive.py isn't importable by name because of the dashes
+    script = os.path.join(os.environ.get('SCRIPT_DIR', '.'), 'upload-to-onedrive.py')
+    spec = importlib.util.spec_from_file_location('upload_to_onedrive', script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.connect()
+
+# Sealed shards are uploaded straight away when an upload target is configured;
+# uploaded shards are removed so only failed ones (and the manifest) are left
+# for the upload job
+uploader = None
+if upload_target == 'onedrive':
+    try:
+        uploader = ShardUploader(load_onedrive_uploader(), delete_after_upload=True)
+    except Exception as e:
+        print(f"Warning: OneDrive not available, shards will be uploaded later: {e}")
+archive = ShardedArchiveWriter(
+    archive_prefix,
+    max_shard_bytes=shard_size_mb * 1024 * 1024,
+    on_shard_sealed=uploader.submit if uploader else None,
+)
+
 print(f"Connecting to Supabase at {url}")
 supabase = create_client(url, key)
+scheduler = get_scheduler()
+storage_host = urlparse(url).hostname
+# Pool as large as the scheduler's ceiling so AIMD can actually reach it
+max_workers = int(scheduler.max_concurrency)
+# storage3 surfaces network failures as httpx errors
+transient_errors = (ConnectionError, TimeoutError, httpx.TransportError)
+
+def storage_call(fn):
+    return scheduler.call(storage_host, fn, retry_on=transient_errors)
+
+def download_file(bucket_name, bucket_path, file_obj):
+    file_name = None
+    try:
+        # Get file name
+        file_name = file_obj.get('name') if isinstance(file_obj, dict) else getattr(file_obj, 'name', str(file_obj))
+        print(f"  Downloading: {file_name}")
+        
+        # Download file
+        res = storage_call(lambda: supabase.storage.from_(bucket_name).download(file_name))
+        
+        # Save file
+        local_path = os.path.join(bucket_path, file_name)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        
+        with open(local_path, 'wb') as f:
+            f.write(res)
+        
+        # Move it into the current shard
+        archive.add(local_path)
+        os.remove(local_path)
+    except Exception as e:
+        print(f"  Error downloading {file_name}: {str(e)}")
 
 try:
     # List all buckets
-    buckets = supabase.storage.list_buckets()
+    buckets = storage_call(lambda: supabase.storage.list_buckets())
     print(f"Found {len(buckets)} storage buckets")
     
     if not buckets:
         print("No storage buckets found. Creating empty backup.")
         # Create empty file to indicate no storage
-        with open(os.path.join(backup_dir, 'NO_STORAGE_BUCKETS.txt'), 'w') as f:
+        marker_path = os.path.join(backup_dir, 'NO_STORAGE_BUCKETS.txt')
+        with open(marker_path, 'w') as f:
             f.write("No storage buckets found at backup time\n")
-        sys.exit(0)
+        archive.add(marker_path)
     
     for bucket in buckets:
         # Handle both dict and object formats
@@ -56,35 +124,46 @@ try:
         
         try:
             # List all files in the bucket
-            files = supabase.storage.from_(bucket_name).list()
+            files = storage_call(lambda: supabase.storage.from_(bucket_name).list())
             
             if not files:
                 print(f"  No files in bucket {bucket_name}")
                 continue
                 
-            for file_obj in files:
-                try:
-                    # Get file name
-                    file_name = file_obj.get('name') if isinstance(file_obj, dict) else getattr(file_obj, 'name', str(file_obj))
-                    print(f"  Downloading: {file_name}")
-                    
-                    # Download file
-                    res = supabase.storage.from_(bucket_name).download(file_name)
-                    
-                    # Save file
-                    local_path = os.path.join(bucket_path, file_name)
-                    os.makedirs(os.path.dirname(local_path), exist_ok=True)
-                    
-                    with open(local_path, 'wb') as f:
-                        f.write(res)
-                except Exception as e:
-                    print(f"  Error downloading {file_name}: {str(e)}")
+            # Downloads run in parallel; the scheduler adapts how many hit the host at once
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for file_obj in files:
+                    executor.submit(download_file, bucket_name, bucket_path, file_obj)
         except Exception as e:
             print(f"Error listing files in bucket {bucket_name}: {str(e)}")
     
+    # Buckets without any files still produce one shard, so every manifest
+    # lists at least one
+    if not archive.file_count:
+        marker_path = os.path.join(backup_dir, 'NO_STORAGE_FILES.txt')
+        with open(marker_path, 'w') as f:
+            f.write("No storage files found at backup time\n")
+        archive.add(marker_path)
+    
+    # The manifest is only written on success, so it always means a complete run
+    manifest_path = archive.close()
+    if uploader:
+        failed = uploader.close()
+        print(f"Uploaded {len(uploader.uploaded)} shards, {len(failed)} left for retry")
+        # The manifest goes up only once every shard is there; otherwise the
+        # upload job sends it after retrying the failed shards. Either way it
+        # stays on disk so the artifact always exists.
+        if not failed:
+            try:
+                uploader.upload_file(manifest_path)
+            except Exception as e:
+                print(f"Error uploading manifest, left for the upload job: {e}")
+    
     print("Storage backup completed successfully!")
     
 except Exception as e:
+    # No manifest: shards already uploaded by this run stay orphaned until
+    # retention removes them, and the job fails
     print(f"Error during storage backup: {str(e)}")
     sys.exit(1)
 EOF
@@ -92,11 +171,11 @@ EOF
 # Run the download script
 export SUPABASE_URL="https://jnuzpixgfskjcoqmgkxb.supabase.co"
 export BACKUP_DIR="$BACKUP_DIR"
-python3 download_storage.py || echo "Storage backup completed with warnings"
-
-# Compress backup
-echo "Compressing storage backup..."
-tar -czf "storage-backup-$(date +%Y%m%d-%H%M%S).tar.gz" "$BACKUP_DIR"
+# Files are compressed into size-capped shards while downloading
+export ARCHIVE_PREFIX="storage-backup-$TIMESTAMP"
+export SCRIPT_DIR="$SCRIPT_DIR"
+export PYTHONPATH="$SCRIPT_DIR${PYTHONPATH:+:$PYTHONPATH}"
+python3 download_storage.py
 
 # Clean up
 rm -rf "$BACKUP_DIR" download_storage.py
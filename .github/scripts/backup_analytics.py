@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""Offline agent progress / earnings reports over database backup archives.
+
+Loads the per-table JSON written by backup-database-api.sh
+(`database-backup-*.tar.gz`, or an extracted backup directory) into columnar
+NumPy arrays and computes, for every task at once, the same rows as
+`supabase/functions/get_task_agent_progress_batch.sql`:
+
+    task_id, agent_id, agent_name, assignment_status, evidence_required,
+    evidence_uploaded, points_total, points_paid, outstanding_balance
+
+Joins go through hash indexes on the key columns and the evidence/payment
+rollups are single bincount passes, instead of the correlated subqueries the
+SQL runs per assignment. Heavy reports can then run against last night's
+backup instead of the production database.
+
+Usage:
+    python backup_analytics.py database-backup-20250101-020000.tar.gz
+    python backup_analytics.py backup-20250101-020000/ --report earnings --format json
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import tarfile
+
+import numpy as np
+
+REQUIRED_TABLES = ('task_assignments', 'evidence', 'payments', 'profiles', 'tasks')
+
+# Supabase's default PostgREST max-rows; unpaginated exports stop here
+POSTGREST_MAX_ROWS = 1000
+
+PROGRESS_COLUMNS = (
+    'task_id', 'agent_id', 'agent_name', 'assignment_status', 'evidence_required',
+    'evidence_uploaded', 'points_total', 'points_paid', 'outstanding_balance',
+)
+EARNINGS_COLUMNS = (
+    'agent_id', 'agent_name', 'assignments', 'completed_assignments',
+    'points_earned', 'points_paid', 'outstanding_balance',
+)
+
+
+def load_tables(path, tables=REQUIRED_TABLES):
+    """Read `<table>.json` records from a backup archive or directory.
+
+    Row counts are checked against metadata.json so a truncated export fails
+    loudly instead of producing wrong rollups.
+    """
+    records = {}
+    metadata = {}
+    if os.path.isdir(path):
+        for table in tables:
+            table_path = os.path.join(path, f'{table}.json')
+            if os.path.exists(table_path):
+                with open(table_path) as f:
+                    records[table] = json.load(f)
+        metadata_path = os.path.join(path, 'metadata.json')
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as f:
+                metadata = json.load(f)
+    else:
+        wanted = {f'{table}.json': table for table in tables}
+        with tarfile.open(path, 'r:*') as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                name = os.path.basename(member.name)
+                if name == 'metadata.json':
+                    metadata = json.load(archive.extractfile(member))
+                elif name in wanted:
+                    records[wanted[name]] = json.load(archive.extractfile(member))
+
+    missing = [table for table in tables if table not in records]
+    if missing:
+        raise ValueError(f"Backup {path} is missing tables: {', '.join(missing)}")
+    check_row_counts(path, records, metadata.get('row_counts'))
+    return {table: ColumnTable.from_records(rows) for table, rows in records.items()}
+
+
+def check_row_counts(path, records, row_counts):
+    """Fail on tables whose row count differs from the export's own count"""
+    if row_counts is None:
+        # Older backups were a single unpaginated request per table
+        for table, rows in records.items():
+            if len(rows) == POSTGREST_MAX_ROWS:
+                print(f"Warning: {table} in {path} has exactly {POSTGREST_MAX_ROWS} rows and the "
+                      f"backup has no row counts; it was probably truncated", file=sys.stderr)
+        return
+    mismatched = [
+        f"{table} ({len(rows)} rows, {row_counts.get(table)} exported)"
+        for table, rows in records.items() if row_counts.get(table) != len(rows)
+    ]
+    if mismatched:
+        raise ValueError(f"Backup {path} has incomplete tables: {', '.join(mismatched)}")
+
+
+class ColumnTable:
+    """A table stored as one NumPy array per column"""
+
+    def __init__(self, columns, length):
+        self.columns = columns
+        self.length = length
+
+    @classmethod
+    def from_records(cls, records):
+        # dict keeps first-seen column order with O(1) membership checks
+        names = {}
+        for record in records:
+            for name in record:
+                names.setdefault(name)
+        columns = {
+            name: np.array([record.get(name) for record in records], dtype=object)
+            for name in names
+        }
+        return cls(columns, len(records))
+
+    def __len__(self):
+        return self.length
+
+    def column(self, name):
+        """Object column (None for missing values, or when the column is absent)"""
+        if name in self.columns:
+            return self.columns[name]
+        return np.full(self.length, None, dtype=object)
+
+    def numeric(self, name, default=0.0):
+        """Column as float64 with NULLs replaced by `default` (SQL COALESCE)"""
+        values = self.column(name)
+        return np.array([default if value is None else float(value) for value in values],
+                        dtype=np.float64)
+
+    def index(self, name):
+        """Hash index on `name`: key -> first row position"""
+        return HashIndex(self.column(name))
+
+
+class HashIndex:
+    """Hash index from key values to row positions"""
+
+    def __init__(self, keys):
+        self.positions = {}
+        for position, key in enumerate(keys):
+            # NULL never equals anything in a SQL join
+            if key is None or (isinstance(key, tuple) and None in key):
+                continue
+            self.positions.setdefault(key, position)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def lookup(self, keys):
+        """Row position for every key, -1 where there is no match"""
+        get = self.positions.get
+        return np.fromiter((get(key, -1) for key in keys), dtype=np.int64, count=len(keys))
+
+
+def task_agent_progress(tables):
+    """Per-assignment progress and payment rollups for every task.
+
+    Mirrors get_task_agent_progress_batch(p_task_id) evaluated for all tasks:
+    inner joins to profiles and tasks, approved evidence per assignment,
+    payments summed per (agent, task), ordered by task then agent name.
+    Returns a dict of equal-length NumPy columns.
+    """
+    assignments = tables['task_assignments']
+    evidence = tables['evidence']
+    payments = tables['payments']
+    profiles = tables['profiles']
+    tasks = tables['tasks']
+
+    # JOIN profiles / tasks (inner joins drop assignments without a match)
+    profile_rows = profiles.index('id').lookup(assignments.column('agent_id'))
+    task_rows = tasks.index('id').lookup(assignments.column('task_id'))
+    keep = (profile_rows >= 0) & (task_rows >= 0)
+    profile_rows = profile_rows[keep]
+    task_rows = task_rows[keep]
+    assignment_ids = assignments.column('id')[keep]
+    agent_ids = assignments.column('agent_id')[keep]
+    task_ids = assignments.column('task_id')[keep]
+    status = assignments.column('status')[keep]
+    count = len(assignment_ids)
+
+    # Approved evidence per assignment in one pass
+    approved = evidence.column('status') == 'approved'
+    evidence_rows = HashIndex(assignment_ids).lookup(evidence.column('task_assignment_id')[approved])
+    evidence_uploaded = np.bincount(evidence_rows[evidence_rows >= 0], minlength=count)
+
+    # Payments summed per (agent, task) pair in one pass; every assignment
+    # of the same pair sees the same sum, as with the correlated subquery
+    pairs = list(zip(agent_ids, task_ids))
+    pair_index = HashIndex(pairs)
+    payment_rows = pair_index.lookup(list(zip(payments.column('agent_id'), payments.column('task_id'))))
+    matched = payment_rows >= 0
+    paid_by_pair = np.bincount(payment_rows[matched],
+                               weights=payments.numeric('amount')[matched],
+                               minlength=count)
+    pair_rows = pair_index.lookup(pairs)
+    paid = np.where(pair_rows >= 0, paid_by_pair[pair_rows], 0)
+    # SUM(amount)::INTEGER rounds halves away from zero
+    points_paid = (np.sign(paid) * np.floor(np.abs(paid) + 0.5)).astype(np.int64)
+
+    evidence_required = tasks.numeric('required_evidence_count', default=1)[task_rows].astype(np.int64)
+    points_total = tasks.numeric('points')[task_rows].astype(np.int64)
+    outstanding_balance = np.where(status == 'completed',
+                                   np.maximum(0, points_total - points_paid), 0)
+    agent_names = profiles.column('full_name')[profile_rows]
+
+    # ORDER BY p.full_name within each task (NULL names last, as in Postgres).
+    # Names compare case-insensitively first, like the database's locale
+    # collation, with the raw string as tie-breaker; punctuation and accent
+    # rules of a full ICU/glibc collation are not reproduced.
+    null_name = np.array([name is None for name in agent_names], dtype=bool)
+    folded_name = np.array([(name or '').casefold() for name in agent_names], dtype=str)
+    order = np.lexsort((agent_names.astype(str), folded_name, null_name, task_ids.astype(str)))
+
+    result = {
+        'task_id': task_ids,
+        'agent_id': agent_ids,
+        'agent_name': agent_names,
+        'assignment_status': status,
+        'evidence_required': evidence_required,
+        'evidence_uploaded': evidence_uploaded.astype(np.int64),
+        'points_total': points_total,
+        'points_paid': points_paid,
+        'outstanding_balance': outstanding_balance.astype(np.int64),
+    }
+    return {name: values[order] for name, values in result.items()}
+
+
+def agent_earnings(progress):
+    """Roll task progress rows up to one earnings row per agent"""
+    agents, first_row, rows = np.unique(progress['agent_id'].astype(str),
+                                        return_index=True, return_inverse=True)
+    completed = (progress['assignment_status'] == 'completed').astype(np.float64)
+
+    def total(weights):
+        return np.bincount(rows, weights=weights, minlength=len(agents)).astype(np.int64)
+
+    return {
+        'agent_id': progress['agent_id'][first_row],
+        'agent_name': progress['agent_name'][first_row],
+        'assignments': np.bincount(rows, minlength=len(agents)),
+        'completed_assignments': total(completed),
+        'points_earned': total(completed * progress['points_total']),
+        'points_paid': total(progress['points_paid']),
+        'outstanding_balance': total(progress['outstanding_balance']),
+    }
+
+
+def to_records(columns, names):
+    """Columnar result -> list of plain dicts (JSON/CSV friendly)"""
+    return [
+        {name: value.item() if isinstance(value, np.generic) else value
+         for name, value in zip(names, row)}
+        for row in zip(*(columns[name] for name in names))
+    ]
+
+
+def to_dataframe(columns, names):
+    """Columnar result -> pandas DataFrame (pandas is only needed for this)"""
+    import pandas as pd
+    return pd.DataFrame({name: columns[name] for name in names})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agent progress / earnings reports from a database backup")
+    parser.add_argument('backup', help="database-backup-*.tar.gz or an extracted backup directory")
+    parser.add_argument('--report', choices=('progress', 'earnings'), default='progress')
+    parser.add_argument('--task', help="only report this task id (progress report)")
+    parser.add_argument('--format', choices=('csv', 'json'), default='csv')
+    parser.add_argument('--output', help="write to this file instead of stdout")
+    args = parser.parse_args()
+
+    progress = task_agent_progress(load_tables(args.backup))
+    if args.task:
+        selected = progress['task_id'] == args.task
+        progress = {name: values[selected] for name, values in progress.items()}
+
+    if args.report == 'earnings':
+        records = to_records(agent_earnings(progress), EARNINGS_COLUMNS)
+        names = EARNINGS_COLUMNS
+    else:
+        records = to_records(progress, PROGRESS_COLUMNS)
+        names = PROGRESS_COLUMNS
+
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        if args.format == 'json':
+            json.dump(records, out, indent=2, default=str)
+            out.write('\n')
+        else:
+            writer = csv.DictWriter(out, fieldnames=names)
+            writer.writeheader()
+            writer.writerows(records)
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Benchmark Drive client startup: per-file build() vs the shared factory.
+
+Each measurement runs in a fresh interpreter so import costs are included.
+No network access or real credentials are needed. Only upload-to-drive.py
+used to build a client per file; cleanup-old-backups.py and
+test-drive-access.py already built one, which `--files 1` reproduces (both
+variants should then take about the same time).
+
+Usage: python benchmark-drive-startup.py [--runs 5] [--files 3]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# What upload-to-drive.py used to do: build a new client for every file
+LEGACY = """
+import time
+start = time.perf_counter()
+from google.auth.credentials import AnonymousCredentials
+from googleapiclient.discovery import build
+for _ in range({files}):
+    build('drive', 'v3', credentials=AnonymousCredentials())
+print(time.perf_counter() - start)
+"""
+
+# Shared factory: one build per process
+FACTORY = """
+import time
+start = time.perf_counter()
+from google.auth.credentials import AnonymousCredentials
+from drive_client import get_drive_service
+for _ in range({files}):
+    get_drive_service(AnonymousCredentials())
+print(time.perf_counter() - start)
+"""
+
+LEGACY_LABEL = 'build() per file (upload)'
+
+
+def measure(code, runs):
+    """Run `code` in `runs` fresh interpreters and return the timings"""
+    env = dict(os.environ, PYTHONPATH=SCRIPT_DIR)
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', code],
+            env=env, check=True, capture_output=True, text=True
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help="fresh interpreters per variant")
+    parser.add_argument('--files', type=int, default=3, help="Drive clients requested per run")
+    args = parser.parse_args()
+
+    print(f"Drive startup: {args.runs} runs, {args.files} clients per run")
+    results = {}
+    for name, template in ((LEGACY_LABEL, LEGACY), ('drive_client', FACTORY)):
+        timings = measure(template.format(files=args.files), args.runs)
+        results[name] = statistics.median(timings)
+        print(f"  {name:<26} median {results[name] * 1000:8.1f} ms  "
+              f"(min {min(timings) * 1000:.1f}, max {max(timings) * 1000:.1f})")
+
+    legacy, factory = results[LEGACY_LABEL], results['drive_client']
+    print(f"Speedup: {legacy / factory:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
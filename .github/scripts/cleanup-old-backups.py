@@ -1,42 +1,28 @@
 #!/usr/bin/env python3
 import os
-import json
-import base64
 from datetime import datetime, timedelta, timezone
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
+from drive_client import DRIVE_HOST, get_drive_service
+from request_scheduler import get_scheduler
+from sharded_archive import run_name
 
 # Retention settings
 DAILY_RETENTION_DAYS = 30
 WEEKLY_RETENTION_WEEKS = 12
 MONTHLY_RETENTION_MONTHS = 12
 
-def get_credentials():
-    """Get Google service account credentials"""
-    creds_base64 = os.environ.get('GOOGLE_DRIVE_CREDENTIALS')
-    if not creds_base64:
-        raise ValueError("GOOGLE_DRIVE_CREDENTIALS not found in environment")
-    
-    creds_json = base64.b64decode(creds_base64).decode('utf-8')
-    creds_dict = json.loads(creds_json)
-    
-    return service_account.Credentials.from_service_account_info(
-        creds_dict,
-        scopes=['https://www.googleapis.com/auth/drive']
-    )
-
 def list_backup_files(service, folder_id):
     """List all backup files in the folder"""
     all_files = []
     page_token = None
     
     while True:
-        results = service.files().list(
+        request = service.files().list(
             q=f"'{folder_id}' in parents and trashed=false",
             fields="nextPageToken, files(id, name, createdTime)",
             pageToken=page_token,
             pageSize=100
-        ).execute()
+        )
+        results = get_scheduler().call(DRIVE_HOST, request.execute)
         
         all_files.extend(results.get('files', []))
         page_token = results.get('nextPageToken', None)
@@ -47,25 +33,37 @@ def list_backup_files(service, folder_id):
     return all_files
 
 def categorize_backups(files):
-    """Categorize backups by type and date"""
-    database_backups = []
-    storage_backups = []
+    """Categorize backups by type and date.
+
+    Shards and the manifest of one sharded run are grouped into a single
+    backup so retention keeps or deletes them together.
+    """
+    runs = {}
     
     for file in files:
         created_time = datetime.fromisoformat(file['createdTime'].replace('Z', '+00:00'))
+        name = run_name(file['name'])
         
-        if file['name'].startswith('database-backup-'):
-            database_backups.append({
-                'id': file['id'],
-                'name': file['name'],
-                'created': created_time
-            })
-        elif file['name'].startswith('storage-backup-'):
-            storage_backups.append({
-                'id': file['id'],
-                'name': file['name'],
-                'created': created_time
-            })
+        backup = runs.get(name)
+        if backup is None:
+            backup = runs[name] = {
+                'id': name,
+                'name': name,
+                'created': created_time,
+                'files': []
+            }
+        # A run is as old as its first uploaded shard
+        backup['created'] = min(backup['created'], created_time)
+        backup['files'].append({'id': file['id'], 'name': file['name']})
+    
+    database_backups = []
+    storage_backups = []
+    
+    for name, backup in runs.items():
+        if name.startswith('database-backup-'):
+            database_backups.append(backup)
+        elif name.startswith('storage-backup-'):
+            storage_backups.append(backup)
     
     return database_backups, storage_backups
 
@@ -103,18 +101,18 @@ def apply_retention_policy(backups):
     return to_delete
 
 def delete_old_backups(service, to_delete):
-    """Delete old backup files"""
+    """Delete old backup files (every shard of a sharded backup)"""
     for backup in to_delete:
-        try:
-            print(f"Deleting old backup: {backup['name']}")
-            service.files().delete(fileId=backup['id']).execute()
-        except Exception as e:
-            print(f"Error deleting {backup['name']}: {str(e)}")
+        print(f"Deleting old backup: {backup['name']} ({len(backup['files'])} files)")
+        for file in backup['files']:
+            try:
+                get_scheduler().call(DRIVE_HOST, service.files().delete(fileId=file['id']).execute)
+            except Exception as e:
+                print(f"Error deleting {file['name']}: {str(e)}")
 
 def main():
     try:
-        credentials = get_credentials()
-        service = build('drive', 'v3', credentials=credentials)
+        service = get_drive_service()
         folder_id = os.environ.get('GOOGLE_DRIVE_FOLDER_ID')
         
         if not folder_id:
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Shared Google Drive client factory for the backup scripts.
+
+The Drive service is built once per process and reused, so the authorized
+HTTP transport and the parsed discovery document are shared by every call.
+googleapiclient is only imported when a client is first needed. Like a plain
+build('drive', 'v3'), the client uses the discovery document bundled with
+googleapiclient; DRIVE_DISCOVERY_DOCUMENT can point at a different copy.
+"""
+import base64
+import json
+import os
+import threading
+
+DRIVE_SCOPES = ['https://www.googleapis.com/auth/drive']
+DRIVE_HOST = 'www.googleapis.com'
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_credentials(scopes=DRIVE_SCOPES):
+    """Decode and return Google service account credentials"""
+    from google.oauth2 import service_account
+
+    creds_base64 = os.environ.get('GOOGLE_DRIVE_CREDENTIALS')
+    if not creds_base64:
+        raise ValueError("GOOGLE_DRIVE_CREDENTIALS not found in environment")
+
+    creds_json = base64.b64decode(creds_base64).decode('utf-8')
+    creds_dict = json.loads(creds_json)
+
+    return service_account.Credentials.from_service_account_info(
+        creds_dict,
+        scopes=scopes
+    )
+
+
+def build_drive_service(credentials):
+    """Build a Drive v3 client from a local discovery document"""
+    from googleapiclient.discovery import build, build_from_document
+
+    document_path = os.environ.get('DRIVE_DISCOVERY_DOCUMENT')
+    if document_path:
+        with open(document_path) as f:
+            return build_from_document(f.read(), credentials=credentials)
+    return build('drive', 'v3', credentials=credentials, cache_discovery=False)
+
+
+def get_drive_service(credentials=None):
+    """Return the process-wide Drive client, building it on first use.
+
+    `credentials` only matters for the first call; later calls return the
+    same client (and its authorized transport).
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = build_drive_service(credentials or get_credentials())
+        return _service
+
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""Shared request scheduler for the backup scripts.
+
+Every HTTP call made by the backup jobs (Supabase REST/storage, Microsoft
+Graph, Google Drive) goes through one RequestScheduler so that:
+
+- concurrency is limited per host and adapted AIMD style (additive increase
+  on successful responses, multiplicative decrease at most once per round
+  trip on 429/503, connection errors, or small responses that are much
+  slower than the host's recent average)
+- Retry-After is honoured and blocks the whole host, not just one thread
+- transient failures (429, Google's 403 rate-limit errors, 5xx, connection
+  errors) are retried with exponential backoff and full jitter
+"""
+import json
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+# Scheduler settings (can be overridden from the environment)
+MAX_RETRIES = int(os.environ.get('BACKUP_HTTP_MAX_RETRIES', '5'))
+INITIAL_CONCURRENCY = float(os.environ.get('BACKUP_HTTP_INITIAL_CONCURRENCY', '4'))
+MAX_CONCURRENCY = float(os.environ.get('BACKUP_HTTP_MAX_CONCURRENCY', '32'))
+MIN_CONCURRENCY = 1.0
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 60.0
+DECREASE_FACTOR = 0.5
+# A small response this many times slower than the recent average counts as
+# congestion. Larger transfers are skipped: their latency follows payload size.
+LATENCY_CONGESTION_FACTOR = 3.0
+LATENCY_SIGNAL_MAX_BYTES = 64 * 1024
+LATENCY_EWMA_ALPHA = 0.2
+LATENCY_WARMUP_SAMPLES = 5
+
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429, 503}
+# Google APIs report rate limiting as 403 with one of these reasons
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+
+
+def parse_retry_after(value):
+    """Return the Retry-After header value in seconds, or None"""
+    if not value:
+        return None
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def error_reasons(error):
+    """Reasons listed in a googleapiclient HttpError (error_details or body)"""
+    reasons = set()
+    details = getattr(error, 'error_details', None)
+    if isinstance(details, list):
+        reasons.update(detail.get('reason') for detail in details if isinstance(detail, dict))
+    content = getattr(error, 'content', None)
+    if content:
+        try:
+            body = json.loads(content.decode('utf-8') if isinstance(content, bytes) else content)
+            for detail in body.get('error', {}).get('errors', []):
+                reasons.add(detail.get('reason'))
+        except (ValueError, AttributeError, TypeError):
+            pass
+    reasons.discard(None)
+    return reasons
+
+
+def status_from_exception(error):
+    """Extract an HTTP status code from a client library exception, if any.
+
+    A Google 403 rate-limit error is reported as 429 so it is throttled and
+    retried like any other rate limit.
+    """
+    # googleapiclient.errors.HttpError
+    resp = getattr(error, 'resp', None)
+    if resp is not None and getattr(resp, 'status', None) is not None:
+        status = int(resp.status)
+        if status == 403 and error_reasons(error) & RATE_LIMIT_REASONS:
+            return 429
+        return status
+    # requests / httpx HTTP errors
+    response = getattr(error, 'response', None)
+    if response is not None and getattr(response, 'status_code', None) is not None:
+        return int(response.status_code)
+    # storage3 StorageException carries a dict with statusCode
+    for arg in getattr(error, 'args', ()):
+        if isinstance(arg, dict) and 'statusCode' in arg:
+            try:
+                return int(arg['statusCode'])
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+def retry_after_from_exception(error):
+    """Extract a Retry-After value (seconds) from a client library exception"""
+    resp = getattr(error, 'resp', None)
+    if resp is not None and hasattr(resp, 'get'):
+        return parse_retry_after(resp.get('retry-after'))
+    response = getattr(error, 'response', None)
+    if response is not None and getattr(response, 'headers', None) is not None:
+        return parse_retry_after(response.headers.get('Retry-After'))
+    return None
+
+
+def body_length(body, start=None):
+    """Size in bytes of a request body (0 when unknown or absent)"""
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, bytearray, str)):
+        return len(body)
+    if hasattr(body, 'fileno'):
+        try:
+            return os.fstat(body.fileno()).st_size - (start or 0)
+        except (OSError, ValueError):
+            return 0
+    return 0
+
+
+class HostLimiter:
+    """AIMD concurrency limit and throttle state for a single host"""
+
+    def __init__(self, host, initial=INITIAL_CONCURRENCY,
+                 minimum=MIN_CONCURRENCY, maximum=MAX_CONCURRENCY):
+        self.host = host
+        self.limit = float(initial)
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.latency_average = None
+        self.latency_samples = 0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """Wait for a free slot (and any Retry-After pause) on this host"""
+        with self.condition:
+            while True:
+                wait = self.blocked_until - time.monotonic()
+                if wait > 0:
+                    self.condition.wait(wait)
+                    continue
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                self.condition.wait()
+
+    def _latency_congested(self, latency, size):
+        """Compare a small response's latency with the recent average"""
+        if latency is None or size is None or size > LATENCY_SIGNAL_MAX_BYTES:
+            return False
+        average = self.latency_average
+        if self.latency_samples >= LATENCY_WARMUP_SAMPLES and \
+                latency > average * LATENCY_CONGESTION_FACTOR:
+            return True
+        self.latency_samples += 1
+        if average is None:
+            self.latency_average = latency
+        else:
+            self.latency_average = average + LATENCY_EWMA_ALPHA * (latency - average)
+        return False
+
+    def release(self, started, succeeded=False, latency=None, size=None,
+                throttled=False, retry_after=None):
+        """Free a slot and adjust the limit from the observed outcome.
+
+        `started` is the monotonic time the request was sent; congestion
+        reported by requests sent before the last decrease is ignored, so
+        a burst of failures from one round trip only halves the limit once.
+        """
+        with self.condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+
+            congested = throttled or self._latency_congested(latency, size)
+
+            old_limit = self.limit
+            if congested:
+                if started >= self.last_decrease:
+                    self.limit = max(self.minimum, self.limit * DECREASE_FACTOR)
+                    self.last_decrease = now
+            elif succeeded:
+                # Roughly +1 slot per round of `limit` successful requests
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+            if int(self.limit) != int(old_limit):
+                print(f"    [{self.host}] concurrency {int(old_limit)} -> {int(self.limit)}")
+            self.condition.notify_all()
+
+
+class RequestScheduler:
+    """Retrying, per-host rate-adaptive front end for HTTP calls"""
+
+    def __init__(self, session=None, max_retries=MAX_RETRIES,
+                 initial_concurrency=INITIAL_CONCURRENCY,
+                 max_concurrency=MAX_CONCURRENCY, sleep=time.sleep):
+        self._session = session
+        self.max_retries = max_retries
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self._sleep = sleep
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        return self._session
+
+    def limiter(self, host):
+        """Return the limiter for `host`, creating it on first use"""
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = HostLimiter(host, initial=self.initial_concurrency,
+                                      maximum=self.max_concurrency)
+                self._limiters[host] = limiter
+            return limiter
+
+    def backoff(self, attempt, retry_after=None):
+        """Seconds to wait before retry number `attempt` (1-based)"""
+        if retry_after is not None:
+            # Small jitter so throttled workers don't all return at once
+            return retry_after + random.uniform(0, BACKOFF_BASE_SECONDS)
+        ceiling = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    def request(self, method, url, **kwargs):
+        """Send a request through the shared session with retries.
+
+        Returns the final response; callers still check the status code.
+        File-like `data` bodies are rewound before every retry.
+        """
+        import requests
+
+        host = urlparse(url).hostname or url
+        limiter = self.limiter(host)
+        body = kwargs.get('data')
+        body_start = body.tell() if hasattr(body, 'seek') and hasattr(body, 'tell') else None
+        body_size = body_length(body, body_start)
+
+        attempt = 0
+        while True:
+            attempt += 1
+            if body_start is not None:
+                body.seek(body_start)
+
+            limiter.acquire()
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                limiter.release(started, throttled=True)
+                if attempt > self.max_retries:
+                    raise
+                delay = self.backoff(attempt)
+                print(f"    {method} {host} failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+                self._sleep(delay)
+                continue
+
+            status = response.status_code
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            throttled = status in THROTTLE_STATUSES
+            if status in RETRYABLE_STATUSES:
+                limiter.release(started, throttled=throttled,
+                                retry_after=retry_after if throttled else None)
+            else:
+                limiter.release(started, succeeded=True,
+                                latency=time.monotonic() - started,
+                                size=body_size + len(response.content))
+
+            if status not in RETRYABLE_STATUSES or attempt > self.max_retries:
+                return response
+
+            delay = self.backoff(attempt, retry_after)
+            print(f"    {method} {host} returned {status}, retrying in {delay:.1f}s")
+            response.close()
+            self._sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def call(self, host, fn, retry_on=(ConnectionError, TimeoutError)):
+        """Run `fn()` (e.g. a googleapiclient `.execute`) under the limiter for `host`.
+
+        Exceptions carrying a retryable HTTP status, or matching `retry_on`,
+        are retried; anything else is re-raised immediately.
+        """
+        limiter = self.limiter(host)
+        attempt = 0
+        while True:
+            attempt += 1
+            limiter.acquire()
+            started = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                status = status_from_exception(e)
+                retry_after = retry_after_from_exception(e)
+                throttled = status in THROTTLE_STATUSES or (status is None and isinstance(e, retry_on))
+                limiter.release(started, throttled=throttled,
+                                retry_after=retry_after if status in THROTTLE_STATUSES else None)
+
+                retryable = status in RETRYABLE_STATUSES or (status is None and isinstance(e, retry_on))
+                if not retryable or attempt > self.max_retries:
+                    raise
+                delay = self.backoff(attempt, retry_after)
+                print(f"    {host} call failed ({status or e.__class__.__name__}), retrying in {delay:.1f}s")
+                self._sleep(delay)
+                continue
+
+            # Only byte payloads have a known size; other results skip the latency signal
+            size = len(result) if isinstance(result, (bytes, bytearray)) else None
+            limiter.release(started, succeeded=True,
+                            latency=time.monotonic() - started, size=size)
+            return result
+
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Return the process-wide scheduler shared by all backup HTTP calls"""
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = RequestScheduler()
+        return _default_scheduler
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""Size-capped sharded tar.gz archives for the backup jobs.
+
+A run named e.g. `storage-backup-20250101-020000` is written as
+
+    storage-backup-20250101-020000.part0001.tar.gz
+    storage-backup-20250101-020000.part0002.tar.gz
+    ...
+    storage-backup-20250101-020000.manifest.json
+
+Every shard is a self-contained tar.gz (extract them all into one directory
+to restore). As soon as a shard reaches the size cap it is sealed and handed
+to `on_shard_sealed`, so uploading can overlap with filling the next shard.
+The manifest is not handed over: the caller uploads it once every shard is
+in place, so a manifest in the backup folder always means a complete run.
+"""
+import hashlib
+import json
+import os
+import queue
+import re
+import tarfile
+import threading
+from datetime import datetime, timezone
+
+# Shards of many small files stay under this cap. A single file larger than
+# the cap gets a shard of its own that exceeds it (tar members are not split),
+# so uploaders must cope with shards of any size; the OneDrive uploader
+# switches to an upload session above the 250 MB simple-upload limit.
+DEFAULT_SHARD_SIZE_MB = 200
+
+SHARD_SUFFIX_PATTERN = re.compile(r'\.(part\d+\.tar\.gz|manifest\.json)$')
+
+
+def run_name(file_name):
+    """Return the backup run a file belongs to (shards share one run name)"""
+    match = SHARD_SUFFIX_PATTERN.search(file_name)
+    if match:
+        return file_name[:match.start()]
+    if file_name.endswith('.tar.gz'):
+        return file_name[:-len('.tar.gz')]
+    return file_name
+
+
+def is_backup_file(file_name):
+    """True for monolithic archives, shards and shard manifests"""
+    return file_name.endswith('.tar.gz') or file_name.endswith('.manifest.json')
+
+
+def load_manifest(manifest_path):
+    """Read a run manifest; a manifest without shards is rejected"""
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if not manifest.get('shards'):
+        raise ValueError(f"{os.path.basename(manifest_path)} lists no shards")
+    return manifest
+
+
+def missing_shards(manifest_path, available_names):
+    """Shard names listed in a manifest that are not in `available_names`"""
+    manifest = load_manifest(manifest_path)
+    return [shard['name'] for shard in manifest['shards'] if shard['name'] not in available_names]
+
+
+def sha256_of(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ShardedArchiveWriter:
+    """Write files into size-capped tar.gz shards plus a manifest"""
+
+    def __init__(self, prefix, max_shard_bytes=DEFAULT_SHARD_SIZE_MB * 1024 * 1024,
+                 output_dir='.', on_shard_sealed=None):
+        self.prefix = prefix
+        self.max_shard_bytes = max_shard_bytes
+        self.output_dir = output_dir
+        self.on_shard_sealed = on_shard_sealed
+        self.shards = []
+        self.file_count = 0
+        self._lock = threading.Lock()
+        self._raw = None
+        self._tar = None
+        self._path = None
+        self._members = 0
+        self._closed = False
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.output_dir, f'{self.prefix}.manifest.json')
+
+    def _open_shard(self):
+        index = len(self.shards) + 1
+        self._path = os.path.join(self.output_dir, f'{self.prefix}.part{index:04d}.tar.gz')
+        self._raw = open(self._path, 'wb')
+        self._tar = tarfile.open(fileobj=self._raw, mode='w:gz')
+        self._members = 0
+
+    def _seal_shard(self):
+        self._tar.close()
+        self._raw.close()
+        shard = {
+            'name': os.path.basename(self._path),
+            'size': os.path.getsize(self._path),
+            'sha256': sha256_of(self._path),
+            'files': self._members,
+        }
+        self.shards.append(shard)
+        path = self._path
+        self._tar = self._raw = self._path = None
+        print(f"Sealed shard {shard['name']} ({shard['size']} bytes, {shard['files']} files)")
+        if self.on_shard_sealed:
+            self.on_shard_sealed(path)
+
+    def add(self, path, arcname=None):
+        """Add a file; seals the current shard once it reaches the size cap"""
+        with self._lock:
+            if self._closed:
+                raise ValueError("Archive already closed")
+            # Compressed bytes flushed so far lag behind gzip's buffer, so
+            # assume the worst case (incompressible) for the incoming file
+            if self._tar is not None and self._members and \
+                    self._raw.tell() + os.path.getsize(path) > self.max_shard_bytes:
+                self._seal_shard()
+            if self._tar is None:
+                self._open_shard()
+            self._tar.add(path, arcname=arcname)
+            self._members += 1
+            self.file_count += 1
+            if self._raw.tell() >= self.max_shard_bytes:
+                self._seal_shard()
+
+    def close(self):
+        """Seal the last shard and write the manifest; returns the manifest path"""
+        with self._lock:
+            if self._closed:
+                return self.manifest_path
+            self._closed = True
+            if self._tar is not None:
+                self._seal_shard()
+            if not self.shards:
+                raise ValueError("Refusing to write a manifest without shards")
+            manifest = {
+                'backup': self.prefix,
+                'created': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
+                'max_shard_bytes': self.max_shard_bytes,
+                'total_bytes': sum(shard['size'] for shard in self.shards),
+                'shards': self.shards,
+            }
+            with open(self.manifest_path, 'w') as f:
+                json.dump(manifest, f, indent=2)
+            print(f"Wrote manifest {os.path.basename(self.manifest_path)} ({len(self.shards)} shards)")
+            return self.manifest_path
+
+
+class ShardUploader:
+    """Upload sealed shards on a background thread while the next one fills"""
+
+    def __init__(self, upload_file, delete_after_upload=False):
+        self.upload_file = upload_file
+        self.delete_after_upload = delete_after_upload
+        self.uploaded = []
+        self.failed = []
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, path):
+        self._queue.put(path)
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            if path is None:
+                return
+            try:
+                self.upload_file(path)
+                self.uploaded.append(path)
+                if self.delete_after_upload:
+                    os.remove(path)
+            except Exception as e:
+                print(f"Error uploading {os.path.basename(path)}: {e}")
+                self.failed.append(path)
+
+    def close(self):
+        """Wait for queued uploads; returns the list of paths that failed"""
+        self._queue.put(None)
+        self._thread.join()
+        return self.failed
@@ -2,10 +2,7 @@
 import os
 import json
 import base64
-from google.oauth2 import service_account
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from drive_client import get_drive_service
 
 def get_credentials():
     """Get Google credentials (OAuth or Service Account)"""
@@ -26,6 +23,8 @@ def get_credentials():
     
     elif 'client_email' in creds_dict:
         # Service account credentials
+        from google.oauth2 import service_account
+        
         print("Service account credentials detected")
         credentials = service_account.Credentials.from_service_account_info(
             creds_dict,
@@ -54,7 +53,7 @@ def test_drive_access():
     """Test Google Drive access and folder permissions"""
     try:
         credentials = get_credentials()
-        service = build('drive', 'v3', credentials=credentials)
+        service = get_drive_service(credentials)
         folder_id = os.environ.get('GOOGLE_DRIVE_FOLDER_ID')
         
         print(f"Testing Google Drive access...")
@@ -1,31 +1,15 @@
 #!/usr/bin/env python3
 import os
 import sys
-import json
-import base64
 from datetime import datetime
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
-
-def get_credentials():
-    """Decode and return Google service account credentials"""
-    creds_base64 = os.environ.get('GOOGLE_DRIVE_CREDENTIALS')
-    if not creds_base64:
-        raise ValueError("GOOGLE_DRIVE_CREDENTIALS not found in environment")
-    
-    creds_json = base64.b64decode(creds_base64).decode('utf-8')
-    creds_dict = json.loads(creds_json)
-    
-    return service_account.Credentials.from_service_account_info(
-        creds_dict,
-        scopes=['https://www.googleapis.com/auth/drive']
-    )
+from drive_client import get_drive_service
+from sharded_archive import is_backup_file
 
 def upload_to_drive(file_path, folder_id):
     """Upload a file to Google Drive"""
-    credentials = get_credentials()
-    service = build('drive', 'v3', credentials=credentials)
+    from googleapiclient.http import MediaFileUpload
+    
+    service = get_drive_service()
     
     # Get absolute path and verify file exists
     abs_file_path = os.path.abspath(file_path)
@@ -76,17 +60,19 @@ def main():
     print("Looking for backup files...")
     backup_files = []
     
-    # Upload all backup files
+    # Upload all backup files (archives, shards and shard manifests)
     for file_name in os.listdir('.'):
-        if file_name.endswith('.tar.gz'):
+        if is_backup_file(file_name):
             backup_files.append(file_name)
             print(f"Found backup file: {file_name}")
+    # Manifests last so a listed sharded run is complete
+    backup_files.sort(key=lambda name: (name.endswith('.manifest.json'), name))
     
     if not backup_files:
         print("No backup files found! Listing all files:")
         for file_name in os.listdir('.'):
             print(f"  {file_name}")
-        raise ValueError("No .tar.gz backup files found to upload")
+        raise ValueError("No backup files found to upload")
     
     # Upload each backup file
     for file_name in backup_files:
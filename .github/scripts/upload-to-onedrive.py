@@ -2,8 +2,11 @@
 import os
 import sys
 import json
-import requests
 from datetime import datetime
+from request_scheduler import get_scheduler
+from sharded_archive import is_backup_file, missing_shards
+
+scheduler = get_scheduler()
 
 def get_access_token():
     """Get OAuth2 access token for Microsoft Graph API"""
@@ -24,7 +27,7 @@ def get_access_token():
         'scope': 'https://graph.microsoft.com/.default'
     }
     
-    response = requests.post(token_url, data=data)
+    response = scheduler.post(token_url, data=data)
     response.raise_for_status()
     
     token_data = response.json()
@@ -39,7 +42,7 @@ def get_drive_info(access_token):
     
     # List available drives and use the first one (usually personal OneDrive)
     drives_url = "https://graph.microsoft.com/v1.0/drives"
-    response = requests.get(drives_url, headers=headers)
+    response = scheduler.get(drives_url, headers=headers)
     response.raise_for_status()
     
     drives = response.json()
@@ -59,7 +62,7 @@ def ensure_backup_folder(access_token, drive_id):
     
     # Check if folder exists
     search_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/root/children"
-    response = requests.get(search_url, headers=headers)
+    response = scheduler.get(search_url, headers=headers)
     response.raise_for_status()
     
     items = response.json()
@@ -76,13 +79,52 @@ def ensure_backup_folder(access_token, drive_id):
         "@microsoft.graph.conflictBehavior": "replace"
     }
     
-    response = requests.post(create_folder_url, headers=headers, json=folder_data)
+    response = scheduler.post(create_folder_url, headers=headers, json=folder_data)
     response.raise_for_status()
     
     folder_info = response.json()
     print(f"Created backup folder: {folder_name}")
     return folder_info['id']
 
+# Graph's simple upload (PUT .../content) accepts files up to 250 MB; larger
+# files go through an upload session in chunks that are multiples of 320 KiB
+SIMPLE_UPLOAD_MAX_BYTES = 250 * 1024 * 1024
+UPLOAD_CHUNK_BYTES = 32 * 320 * 1024
+
+def upload_large_file_to_onedrive(access_token, drive_id, folder_id, file_path):
+    """Upload a file over 250 MB to OneDrive through an upload session"""
+    file_name = os.path.basename(file_path)
+    file_size = os.path.getsize(file_path)
+    
+    session_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/items/{folder_id}:/{file_name}:/createUploadSession"
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+        'Content-Type': 'application/json'
+    }
+    session_data = {"item": {"@microsoft.graph.conflictBehavior": "replace"}}
+    
+    response = scheduler.post(session_url, headers=headers, json=session_data)
+    response.raise_for_status()
+    upload_url = response.json()['uploadUrl']
+    
+    # The upload URL is pre-authenticated; Graph rejects an Authorization header on it
+    with open(file_path, 'rb') as file_data:
+        offset = 0
+        while offset < file_size:
+            chunk = file_data.read(UPLOAD_CHUNK_BYTES)
+            end = offset + len(chunk) - 1
+            chunk_headers = {
+                'Content-Length': str(len(chunk)),
+                'Content-Range': f'bytes {offset}-{end}/{file_size}'
+            }
+            response = scheduler.put(upload_url, headers=chunk_headers, data=chunk)
+            response.raise_for_status()
+            offset = end + 1
+            print(f"   {offset}/{file_size} bytes uploaded")
+    
+    # The last chunk's response carries the created item
+    return response.json()
+
 def upload_file_to_onedrive(access_token, drive_id, folder_id, file_path):
     """Upload a file to OneDrive backup folder"""
     file_name = os.path.basename(file_path)
@@ -90,46 +132,93 @@ def upload_file_to_onedrive(access_token, drive_id, folder_id, file_path):
     
     print(f"Uploading {file_name} ({file_size} bytes)...")
     
-    # For files larger than 4MB, we should use resumable upload
-    # For now, using simple upload (works for most backup files)
-    upload_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/items/{folder_id}:/{file_name}:/content"
+    if file_size > SIMPLE_UPLOAD_MAX_BYTES:
+        file_info = upload_large_file_to_onedrive(access_token, drive_id, folder_id, file_path)
+    else:
+        upload_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/items/{folder_id}:/{file_name}:/content"
+        
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/octet-stream'
+        }
+        
+        with open(file_path, 'rb') as file_data:
+            response = scheduler.put(upload_url, headers=headers, data=file_data)
+            response.raise_for_status()
+        file_info = response.json()
     
+    print(f"✅ Upload complete: {file_info['name']} (ID: {file_info['id']})")
+    return file_info['id']
+
+def list_folder_names(access_token, drive_id, folder_id):
+    """Return the names of all files in the backup folder"""
     headers = {
         'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/octet-stream'
+        'Content-Type': 'application/json'
     }
     
-    with open(file_path, 'rb') as file_data:
-        response = requests.put(upload_url, headers=headers, data=file_data)
+    names = set()
+    url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/items/{folder_id}/children?$select=name"
+    while url:
+        response = scheduler.get(url, headers=headers)
         response.raise_for_status()
+        page = response.json()
+        names.update(item['name'] for item in page.get('value', []))
+        url = page.get('@odata.nextLink')
+    return names
+
+def open_backup_folder():
+    """Authenticate and return (access_token, drive_id, folder_id)"""
+    # Get access token
+    access_token = get_access_token()
+    print("✅ Obtained access token")
     
-    file_info = response.json()
-    print(f"✅ Upload complete: {file_info['name']} (ID: {file_info['id']})")
-    return file_info['id']
+    # Get drive info
+    drive_id = get_drive_info(access_token)
+    print(f"✅ Using drive: {drive_id}")
+    
+    # Ensure backup folder exists
+    folder_id = ensure_backup_folder(access_token, drive_id)
+    print(f"✅ Backup folder ready: {folder_id}")
+    
+    return access_token, drive_id, folder_id
+
+def connect():
+    """Authenticate and return a function that uploads one file to the backup folder"""
+    access_token, drive_id, folder_id = open_backup_folder()
+    
+    def upload(file_path):
+        return upload_file_to_onedrive(access_token, drive_id, folder_id, file_path)
+    
+    return upload
 
 def main():
     """Upload all backup files to OneDrive"""
     try:
         print("Starting OneDrive upload...")
+        access_token, drive_id, folder_id = open_backup_folder()
         
-        # Get access token
-        access_token = get_access_token()
-        print("✅ Obtained access token")
-        
-        # Get drive info
-        drive_id = get_drive_info(access_token)
-        print(f"✅ Using drive: {drive_id}")
+        # Upload all backup files; shard manifests go last so a listed run is complete
+        backup_files = sorted(
+            (file_name for file_name in os.listdir('.') if is_backup_file(file_name)),
+            key=lambda name: (name.endswith('.manifest.json'), name)
+        )
         
-        # Ensure backup folder exists
-        folder_id = ensure_backup_folder(access_token, drive_id)
-        print(f"✅ Backup folder ready: {folder_id}")
+        # Every shard a manifest lists must be on disk (to upload now) or
+        # already uploaded by the backup job
+        manifests = [file_name for file_name in backup_files if file_name.endswith('.manifest.json')]
+        if manifests:
+            available = set(backup_files) | list_folder_names(access_token, drive_id, folder_id)
+            for manifest in manifests:
+                missing = missing_shards(manifest, available)
+                if missing:
+                    raise ValueError(f"{manifest} lists shards that are neither on disk nor on OneDrive: {', '.join(missing)}")
+            print(f"✅ All shards listed in {len(manifests)} manifests are accounted for")
         
-        # Upload all backup files
         uploaded_files = []
-        for file_name in os.listdir('.'):
-            if file_name.endswith('.tar.gz'):
-                file_id = upload_file_to_onedrive(access_token, drive_id, folder_id, file_name)
-                uploaded_files.append(file_name)
+        for file_name in backup_files:
+            upload_file_to_onedrive(access_token, drive_id, folder_id, file_name)
+            uploaded_files.append(file_name)
         
         if uploaded_files:
             print(f"\n🎉 Successfully uploaded {len(uploaded_files)} backup files:")